@@ -1,8 +1,22 @@
 import re
+import os
+import sys
+import glob
+import stat
+import time
 import json
+import signal
+import hashlib
+import tempfile
 from datetime import datetime as dt
 import argparse
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 
 def extract_sensor_metadata(file_content: str, num_sensors):
     # section entire preboxup log into just the final selftest
@@ -640,30 +654,291 @@ def extract_sensor_metadata(file_content: str, num_sensors):
 
     return structure
 
+# prefix for temp files so stale ones from a killed run can be found and removed
+TMP_PREFIX = ".prebox_"
+TMP_SUFFIX = ".tmp"
+
+
+def fsync_dir(path):
+    # make a rename in this directory durable (not supported on Windows)
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(data, output_file):
+    # write to a temp file in the same directory, then rename over the target
+    # so a crash mid-write never leaves partial JSON at output_file
+    out_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=TMP_PREFIX, suffix=TMP_SUFFIX)
+    try:
+        # mkstemp creates 0600; match what a plain open(..., "w") would give
+        if os.path.exists(output_file):
+            mode = stat.S_IMODE(os.stat(output_file).st_mode)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        if hasattr(os, "fchmod"):
+            os.fchmod(fd, mode)
+        with os.fdopen(fd, "w", encoding="latin-1", errors='ignore') as f:
+            json.dump(data, f, indent=2)  # indent=2 makes it pretty-printed
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(out_dir)
+
+
+def read_preboxup_log(preboxup_log):
+    # read the log once, returning its text and the sha256 of the exact bytes read
+    with open(preboxup_log, 'rb') as file:
+        raw = file.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    # same newline handling as reading in text mode
+    file_content = raw.decode("latin-1").replace("\r\n", "\n").replace("\r", "\n")
+    return file_content, digest
+
+
+def convert_content(file_content, num_sensors, output_file):
+    # find variable in Selftest format
+    data = extract_sensor_metadata(file_content, num_sensors + 1)
+
+    # Print to screen
+    #print(json.dumps(data, indent=2))
+
+    write_json_atomic(data, output_file)
+
+
 def prebox_to_json(preboxup_log, num_sensors, output_file):
-    with open(preboxup_log, 'r', encoding="latin-1") as file:
-        file_content = file.read()
+    file_content, digest = read_preboxup_log(preboxup_log)
+    convert_content(file_content, num_sensors, output_file)
+    return digest
+
+
+# a log whose conversion killed the process this many times is skipped on resume
+MAX_CRASHES = 2
+
+
+def load_journal(journal_file):
+    # journal is one JSON object per line:
+    # {"input", "sha256", "output", "num_sensors", "status", "crashes"}
+    # status is "started", "done", "failed" or "interrupted"; later lines win,
+    # and a torn or malformed line from a crash is ignored
+    entries = {}
+    if not os.path.exists(journal_file):
+        return entries
+    with open(journal_file, 'r', encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            if not all(isinstance(entry.get(k), str) for k in ("input", "sha256", "output")):
+                continue
+            entries[entry["input"]] = entry
+    return entries
+
+
+def repair_journal(journal_file):
+    # drop a torn last line (no trailing newline) so new entries start on a fresh line
+    if not os.path.exists(journal_file):
+        return
+    with open(journal_file, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+
+def lock_file(path):
+    # take an exclusive lock so two batch runs cannot share a journal or output directory
+    f = open(path, 'a')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        raise RuntimeError(f"another batch run holds {path}")
+    return f
+
+
+def remove_stale_tmp_files(output_dir, started_at):
+    # temp files left behind when a run was killed mid-write; anything newer than
+    # this run may belong to a single-file conversion still in progress
+    for tmp_path in glob.glob(os.path.join(output_dir, TMP_PREFIX + "*" + TMP_SUFFIX)):
+        try:
+            if os.path.getmtime(tmp_path) < started_at:
+                os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def batch_prebox_to_json(preboxup_logs, num_sensors, output_dir, journal_file=None,
+                         resume=False, sync_every=10, retry_failed=False):
+    started_at = time.time()
+    if sync_every < 1:
+        raise ValueError(f"sync_every must be at least 1, got {sync_every}")
+
+    # map each input to its output name, refusing names that would overwrite each other
+    outputs = {}
+    writers = {}
+    for preboxup_log in preboxup_logs:
+        input_path = os.path.abspath(preboxup_log)
+        name = os.path.splitext(os.path.basename(input_path))[0] + ".json"
+        output_file = os.path.abspath(os.path.join(output_dir, name))
+        if output_file in writers:
+            raise ValueError(f"{writers[output_file]} and {input_path} would both write {output_file}")
+        writers[output_file] = input_path
+        outputs[input_path] = output_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    if journal_file is None:
+        journal_file = os.path.join(output_dir, ".prebox_journal.jsonl")
+
+    lock_paths = sorted({os.path.abspath(os.path.join(output_dir, ".prebox.lock")),
+                         os.path.abspath(journal_file) + ".lock"})
+    locks = []
+    try:
+        for lock_path in lock_paths:
+            locks.append(lock_file(lock_path))
+        remove_stale_tmp_files(output_dir, started_at)
+        return _run_batch(outputs, num_sensors, journal_file, resume, sync_every, retry_failed)
+    finally:
+        for lock in locks:
+            lock.close()
+
+
+def _run_batch(outputs, num_sensors, journal_file, resume, sync_every, retry_failed):
+    # on resume, skip logs already converted with the same content, output and
+    # sensor count; logs that failed, or killed the process MAX_CRASHES times,
+    # are skipped unless retry_failed
+    entries = {}
+    if resume:
+        entries = load_journal(journal_file)
+        repair_journal(journal_file)
+
+    converted = 0
+    skipped = 0
+    failed = []
+    with open(journal_file, 'a' if resume else 'w', encoding="utf-8") as journal:
+
+        # every line is flushed, so it survives the process being killed;
+        # fsync (surviving a power loss or OS crash) happens every sync_every files
+        def record(input_path, digest, output_file, status, crashes=0):
+            journal.write(json.dumps({"input": input_path, "sha256": digest,
+                                      "output": output_file, "num_sensors": num_sensors,
+                                      "status": status, "crashes": crashes}) + "\n")
+            journal.flush()
+
+        for input_path, output_file in outputs.items():
+            try:
+                file_content, digest = read_preboxup_log(input_path)
+            except OSError as e:
+                print(f"failed to read {input_path}: {e}", file=sys.stderr)
+                failed.append(input_path)
+                continue
+
+            crashes = 0
+            entry = entries.get(input_path)
+            if (entry and entry["sha256"] == digest and entry["output"] == output_file
+                    and entry.get("num_sensors") == num_sensors):
+                status = entry.get("status")
+                if status == "done" and os.path.exists(output_file):
+                    skipped += 1
+                    continue
+                if status == "started":
+                    # "started" with no later line means the process died on this log
+                    crashes = entry.get("crashes", 0) + 1
+                elif status == "interrupted":
+                    crashes = entry.get("crashes", 0)
+                if not retry_failed and (status == "failed" or crashes >= MAX_CRASHES):
+                    reason = "failed" if status == "failed" else f"crashed {crashes} times"
+                    print(f"skipping {input_path}: {reason} on previous runs "
+                          f"(use --retry-failed to try again)", file=sys.stderr)
+                    failed.append(input_path)
+                    continue
+                if retry_failed:
+                    crashes = 0
+
+            record(input_path, digest, output_file, "started", crashes)
+            try:
+                convert_content(file_content, num_sensors, output_file)
+            except Exception as e:
+                print(f"failed to convert {input_path}: {type(e).__name__}: {e}", file=sys.stderr)
+                record(input_path, digest, output_file, "failed")
+                failed.append(input_path)
+                continue
+            except (KeyboardInterrupt, SystemExit):
+                # stopped from outside, not by this log: retry it on resume
+                record(input_path, digest, output_file, "interrupted", crashes)
+                os.fsync(journal.fileno())
+                raise
+
+            record(input_path, digest, output_file, "done")
+            converted += 1
+
+            if converted % sync_every == 0:
+                os.fsync(journal.fileno())
 
-        # find variable in Selftest format
-        data = extract_sensor_metadata(file_content, num_sensors + 1)
+        os.fsync(journal.fileno())
 
-        # Convert dict → JSON string
-        json_string = json.dumps(data, indent=2)
+    print(f"converted {converted} file(s), skipped {skipped} already done, {len(failed)} failed")
+    return failed
 
-        # Print to screen
-        #print(json_string)
-        # test github
 
-    with open(output_file, "w", encoding="latin-1", errors='ignore') as f:
-        json.dump(data, f, indent=2)  # indent=2 makes it pretty-printed
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert Preboxup log to JSON")
-    parser.add_argument("file_path", help="Path to the log file")
+    parser.add_argument("file_path", help="Path to the log file, or a directory of log files for batch mode")
     parser.add_argument("num_sensors", type=int, help="Number of sensors")
-    parser.add_argument("output_file", help="Output JSON filename")
+    parser.add_argument("output_file", help="Output JSON filename, or output directory in batch mode")
+    parser.add_argument("--pattern", default="*.log",
+                        help="Glob for log files in batch mode (default: *.log)")
+    parser.add_argument("--journal",
+                        help="Journal of completed files in batch mode (default: <output dir>/.prebox_journal.jsonl)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip files already recorded in the journal with an unchanged hash")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="With --resume, retry files that failed or repeatedly crashed on previous runs")
+    parser.add_argument("--sync-every", type=positive_int, default=10,
+                        help="fsync the journal after this many converted files (default: 10); "
+                             "entries are flushed after every file either way")
 
     args = parser.parse_args()
 
-    prebox_to_json(args.file_path, args.num_sensors, args.output_file)
\ No newline at end of file
+    if os.path.isdir(args.file_path):
+        logs = sorted(glob.glob(os.path.join(args.file_path, args.pattern)))
+        if not logs:
+            parser.error(f"no files matching {args.pattern!r} in {args.file_path}")
+        if os.path.exists(args.output_file) and not os.path.isdir(args.output_file):
+            parser.error(f"output directory {args.output_file} is an existing file")
+
+        # turn SIGTERM (e.g. a scheduler time limit) into SystemExit so the
+        # in-flight log is journalled as interrupted rather than crashed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+        try:
+            failed = batch_prebox_to_json(logs, args.num_sensors, args.output_file, args.journal,
+                                          args.resume, args.sync_every, args.retry_failed)
+        except (ValueError, RuntimeError) as e:
+            parser.error(str(e))
+        if failed:
+            sys.exit(1)
+    else:
+        prebox_to_json(args.file_path, args.num_sensors, args.output_file)
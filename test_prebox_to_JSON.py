@@ -0,0 +1,221 @@
+import json
+import os
+import stat
+import time
+
+import pytest
+
+import prebox_to_JSON
+from prebox_to_JSON import batch_prebox_to_json, load_journal, write_json_atomic
+
+GOOD_LOG = "> o d\n> a\n(Oct 1 2024 12:00:00, 1) FwRev 123 ApfId 9999.\nSBE41cp serno: 1234\n"
+# no "> o d" section, which the parser does not handle
+BAD_LOG = "> a\nfoo\n"
+
+
+def make_logs(tmp_path, logs):
+    in_dir = tmp_path / "in"
+    in_dir.mkdir(exist_ok=True)
+    paths = []
+    for name, content in logs.items():
+        path = in_dir / name
+        path.write_text(content, encoding="latin-1")
+        paths.append(str(path))
+    return sorted(paths)
+
+
+def journal_lines(out_dir):
+    with open(out_dir / ".prebox_journal.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_unchanged_inputs(tmp_path):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG, "b.log": GOOD_LOG})
+    out_dir = tmp_path / "out"
+
+    assert batch_prebox_to_json(logs, 7, str(out_dir)) == []
+    first_lines = journal_lines(out_dir)
+
+    assert batch_prebox_to_json(logs, 7, str(out_dir), resume=True) == []
+    assert journal_lines(out_dir) == first_lines
+    assert json.loads((out_dir / "a.json").read_text())["platform_serial_no"] == "9999"
+
+
+def test_resume_reconverts_changed_input(tmp_path):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG, "b.log": GOOD_LOG})
+    out_dir = tmp_path / "out"
+    batch_prebox_to_json(logs, 7, str(out_dir))
+
+    with open(logs[1], "a", encoding="latin-1") as f:
+        f.write("SBE41cp serno: 5678\n")
+    batch_prebox_to_json(logs, 7, str(out_dir), resume=True)
+
+    new_lines = journal_lines(out_dir)[4:]
+    assert [(os.path.basename(e["input"]), e["status"]) for e in new_lines] == [
+        ("b.log", "started"), ("b.log", "done")]
+    assert json.loads((out_dir / "b.json").read_text())["sensors"][0]["sensor_serial_no"] == "5678"
+
+
+def test_torn_journal_line_is_dropped_before_appending(tmp_path):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG, "b.log": GOOD_LOG})
+    out_dir = tmp_path / "out"
+    batch_prebox_to_json(logs[:1], 7, str(out_dir))
+
+    journal = out_dir / ".prebox_journal.jsonl"
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('["not an entry"]\n{"input": "torn')
+
+    batch_prebox_to_json(logs, 7, str(out_dir), resume=True)
+    batch_prebox_to_json(logs, 7, str(out_dir), resume=True)
+
+    entries = load_journal(str(journal))
+    assert {os.path.basename(k): v["status"] for k, v in entries.items()} == {
+        "a.log": "done", "b.log": "done"}
+    assert journal.read_text().endswith("\n")
+
+
+def test_failing_log_does_not_block_the_rest(tmp_path, capsys):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG, "c.log": BAD_LOG, "d.log": GOOD_LOG})
+    out_dir = tmp_path / "out"
+
+    failed = batch_prebox_to_json(logs, 7, str(out_dir))
+    assert [os.path.basename(p) for p in failed] == ["c.log"]
+    assert (out_dir / "d.json").exists()
+    assert not (out_dir / "c.json").exists()
+    assert "c.log" in capsys.readouterr().err
+
+    # skipped on resume, retried with retry_failed
+    failed = batch_prebox_to_json(logs, 7, str(out_dir), resume=True)
+    assert [os.path.basename(p) for p in failed] == ["c.log"]
+    assert "previous run" in capsys.readouterr().err
+    statuses = [e["status"] for e in journal_lines(out_dir) if e["input"].endswith("c.log")]
+    assert statuses == ["started", "failed"]
+
+    batch_prebox_to_json(logs, 7, str(out_dir), resume=True, retry_failed=True)
+    statuses = [e["status"] for e in journal_lines(out_dir) if e["input"].endswith("c.log")]
+    assert statuses == ["started", "failed", "started", "failed"]
+
+
+def test_started_without_done_is_retried_then_quarantined(tmp_path, capsys):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG})
+    out_dir = tmp_path / "out"
+    batch_prebox_to_json(logs, 7, str(out_dir))
+
+    # simulate a process killed mid-conversion: only the "started" line survives
+    journal = out_dir / ".prebox_journal.jsonl"
+    started_line = journal.read_text().splitlines()[0]
+    journal.write_text(started_line + "\n")
+
+    # first crash: retried
+    assert batch_prebox_to_json(logs, 7, str(out_dir), resume=True) == []
+    assert journal_lines(out_dir)[-1]["status"] == "done"
+
+    # killed again on the retry: quarantined
+    crashed_again = dict(json.loads(started_line), crashes=1)
+    journal.write_text(started_line + "\n" + json.dumps(crashed_again) + "\n")
+    failed = batch_prebox_to_json(logs, 7, str(out_dir), resume=True)
+    assert len(failed) == 1
+    assert "crashed 2 times" in capsys.readouterr().err
+
+    assert batch_prebox_to_json(logs, 7, str(out_dir), resume=True, retry_failed=True) == []
+
+
+def test_keyboard_interrupt_is_not_treated_as_crash(tmp_path, monkeypatch):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG, "b.log": GOOD_LOG + "\n"})
+    out_dir = tmp_path / "out"
+
+    real_extract = prebox_to_JSON.extract_sensor_metadata
+
+    def interrupt_on_b(file_content, num_sensors):
+        if file_content.endswith("\n\n"):
+            raise KeyboardInterrupt
+        return real_extract(file_content, num_sensors)
+
+    monkeypatch.setattr(prebox_to_JSON, "extract_sensor_metadata", interrupt_on_b)
+    with pytest.raises(KeyboardInterrupt):
+        batch_prebox_to_json(logs, 7, str(out_dir))
+    assert journal_lines(out_dir)[-1]["status"] == "interrupted"
+
+    monkeypatch.setattr(prebox_to_JSON, "extract_sensor_metadata", real_extract)
+    assert batch_prebox_to_json(logs, 7, str(out_dir), resume=True) == []
+    assert (out_dir / "b.json").exists()
+
+
+def test_resume_reconverts_for_new_output_dir_or_sensor_count(tmp_path):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG})
+    journal = str(tmp_path / "j.jsonl")
+    batch_prebox_to_json(logs, 7, str(tmp_path / "out1"), journal_file=journal)
+
+    batch_prebox_to_json(logs, 7, str(tmp_path / "out2"), journal_file=journal, resume=True)
+    assert (tmp_path / "out2" / "a.json").exists()
+
+    batch_prebox_to_json(logs, 3, str(tmp_path / "out2"), journal_file=journal, resume=True)
+    entries = load_journal(journal)
+    assert [e["num_sensors"] for e in entries.values()] == [3]
+
+
+def test_journal_fsync_follows_sync_every(tmp_path, monkeypatch):
+    logs = make_logs(tmp_path, {f"{i}.log": GOOD_LOG for i in range(5)})
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    journal = out_dir / ".prebox_journal.jsonl"
+
+    journal_syncs = []
+    real_fsync = os.fsync
+
+    def counting_fsync(fd):
+        if journal.exists() and os.path.samestat(os.fstat(fd), os.stat(journal)):
+            journal_syncs.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", counting_fsync)
+    batch_prebox_to_json(logs, 7, str(out_dir), sync_every=2)
+    # after files 2 and 4, and once at the end
+    assert len(journal_syncs) == 3
+
+
+def test_stale_tmp_files_removed_and_concurrent_runs_rejected(tmp_path):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG})
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    stale = out_dir / ".prebox_stale.tmp"
+    stale.write_text("{")
+    os.utime(stale, (0, 0))
+    fresh = out_dir / ".prebox_fresh.tmp"
+    fresh.write_text("{")
+    os.utime(fresh, (time.time() + 60, time.time() + 60))
+
+    batch_prebox_to_json(logs, 7, str(out_dir))
+    assert not stale.exists()
+    assert fresh.exists()
+
+    held = prebox_to_JSON.lock_file(str(out_dir / ".prebox.lock"))
+    try:
+        with pytest.raises(RuntimeError, match="another batch run"):
+            batch_prebox_to_json(logs, 7, str(out_dir))
+    finally:
+        held.close()
+
+
+def test_duplicate_output_names_are_rejected(tmp_path):
+    logs = make_logs(tmp_path, {"x.log": GOOD_LOG, "x.txt": GOOD_LOG})
+    with pytest.raises(ValueError, match="x.json"):
+        batch_prebox_to_json(logs, 7, str(tmp_path / "out"))
+
+
+def test_sync_every_must_be_positive(tmp_path):
+    logs = make_logs(tmp_path, {"a.log": GOOD_LOG})
+    with pytest.raises(ValueError, match="sync_every"):
+        batch_prebox_to_json(logs, 7, str(tmp_path / "out"), sync_every=0)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_atomic_write_uses_umask_mode(tmp_path):
+    old_umask = os.umask(0o022)
+    try:
+        output_file = tmp_path / "out.json"
+        write_json_atomic({"a": 1}, str(output_file))
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(os.stat(output_file).st_mode) == 0o644
+    assert os.listdir(tmp_path) == ["out.json"]